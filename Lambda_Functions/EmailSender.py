@@ -1,5 +1,9 @@
+import os
 import json
 import smtplib
+import socket
+import time
+from functools import lru_cache
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from urllib.parse import unquote_plus
@@ -8,6 +12,19 @@ import boto3
 # Initialize the S3 client
 s3 = boto3.client('s3')
 
+# Email sender credentials
+sender_email = "dibhavsar214@gmail.com"  # Replace with your email
+sender_password = "dmmc bqeh zdfw ticx"  # Replace with your app-specific password or email password
+smtp_server = "smtp.gmail.com"  # Gmail SMTP server
+smtp_port = 587  # SMTP port for TLS
+
+# Presigned URLs are reused within windows of this many seconds (must stay below the URL expiry)
+presign_window_seconds = 1800
+
+# Messages sent over one SMTP connection before it is recycled; set this below the
+# provider's per-connection limit (e.g. 100 for Amazon SES) when switching away from Gmail
+max_messages_per_connection = int(os.environ.get('SMTP_MAX_MESSAGES_PER_CONNECTION', '90'))
+
 def lambda_handler(event, context):
     """
     Lambda handler function to send an email with a download link when a processed file is uploaded to S3.
@@ -20,28 +37,45 @@ def lambda_handler(event, context):
         dict: A response indicating the success or failure of the operation.
     """
     try:
-        # Extract bucket name and object key from the S3 event
-        bucket_name = event['Records'][0]['s3']['bucket']['name']
-        object_key = unquote_plus(event['Records'][0]['s3']['object']['key'])
-
-        print(f"Bucket Name: {bucket_name}")
-        print(f"Decoded Object Key: {object_key}")
-
-        # Generate a presigned URL for the uploaded file
-        file_url = generate_presigned_url(bucket_name, object_key)
-        print(f"Generated presigned URL: {file_url}")
-
-        # Extract the recipient email from the object key (adjust according to the naming convention)
-        email = object_key.split('/')[1]  # Assumes object key format: email/output.csv
-        print(f"Email to send: {email}")
-
-        # Send an email to the recipient with the download link
-        send_email(email, file_url)
+        failed = []  # Object keys of records whose email could not be sent
+
+        # Send one email for every S3 record delivered in this notification
+        for record in event['Records']:
+            object_key = None
+            try:
+                # Extract bucket name and object key from the S3 record
+                bucket_name = record['s3']['bucket']['name']
+                object_key = unquote_plus(record['s3']['object']['key'])
+
+                print(f"Bucket Name: {bucket_name}")
+                print(f"Decoded Object Key: {object_key}")
+
+                # Generate a presigned URL for the uploaded file
+                file_url = generate_presigned_url(bucket_name, object_key)
+                print(f"Generated presigned URL: {file_url}")
+
+                # Extract the recipient email from the object key (adjust according to the naming convention)
+                email = object_key.split('/')[1]  # Assumes object key format: email/output.csv
+                print(f"Email to send: {email}")
+
+                # Send an email to the recipient with the download link
+                send_email(email, file_url)
+            except Exception as e:
+                # Keep going so one bad record does not stop (or, on retry, repeat) the other emails
+                print(f"Error processing record {object_key}: {e}")
+                failed.append(object_key)
+
+        # Report only the records that failed
+        if failed:
+            return {
+                'statusCode': 500,
+                'body': json.dumps(f'Error: failed to send emails for {failed}')
+            }
 
         # Return a success response
         return {
             'statusCode': 200,
-            'body': json.dumps('Email sent successfully.')
+            'body': json.dumps('Emails sent successfully.')
         }
 
     except Exception as e:
@@ -63,16 +97,110 @@ def generate_presigned_url(bucket_name, object_key):
         str: A presigned URL valid for 1 hour.
     """
     try:
-        url = s3.generate_presigned_url(
-            'get_object',
-            Params={'Bucket': bucket_name, 'Key': object_key},
-            ExpiresIn=3600  # URL expires in 1 hour
-        )
-        return url
+        # Reuse the cached URL if this object was already signed in the current window
+        epoch_bucket = int(time.time() // presign_window_seconds)
+        return _presign(bucket_name, object_key, epoch_bucket)
     except Exception as e:
         print(f"Error generating presigned URL: {e}")
         raise
 
+@lru_cache(maxsize=1024)
+def _presign(bucket_name, object_key, epoch_bucket):
+    """
+    Sign a GET URL for the object; results are cached per (bucket, key, time window).
+
+    Args:
+        bucket_name (str): Name of the S3 bucket.
+        object_key (str): Key of the object in the bucket.
+        epoch_bucket (int): Index of the current caching window, used only as part of the cache key.
+
+    Returns:
+        str: A presigned URL valid for 1 hour.
+    """
+    return s3.generate_presigned_url(
+        'get_object',
+        Params={'Bucket': bucket_name, 'Key': object_key},
+        ExpiresIn=3600  # URL expires in 1 hour
+    )
+
+class _SMTPConnection:
+    """
+    Logged-in SMTP connection reused across warm Lambda invocations.
+
+    The connection is health-checked with NOOP before reuse, recycled after
+    max_messages_per_connection messages, and reopened once if the server
+    drops it mid-send.
+    """
+
+    def __init__(self):
+        self.server = None
+        self.messages_sent = 0
+
+    def _connect(self):
+        # Establish a new connection to the SMTP server; it is only cached once logged in,
+        # so a failed STARTTLS or LOGIN never leaves an unauthenticated connection behind
+        server = smtplib.SMTP(smtp_server, smtp_port)
+        try:
+            server.starttls()  # Secure the connection using TLS
+            server.login(sender_email, sender_password)  # Login to the SMTP server
+        except Exception:
+            server.close()
+            raise
+        self.server = server
+        self.messages_sent = 0
+
+    def _close(self):
+        # Close the connection politely, still closing the socket if QUIT fails on a dead connection
+        try:
+            self.server.quit()
+        except (smtplib.SMTPException, socket.error):
+            self.server.close()
+        self.server = None
+
+    def _discard(self):
+        # Drop a dead connection, closing its socket so it does not leak across invocations
+        if self.server is not None:
+            self.server.close()
+        self.server = None
+
+    def _get_server(self):
+        """
+        Return a usable SMTP server, reusing the open connection when it is still alive.
+
+        Returns:
+            smtplib.SMTP: An authenticated SMTP connection.
+        """
+        if self.server is not None and self.messages_sent >= max_messages_per_connection:
+            print("SMTP connection reached its message cap, reconnecting")
+            self._close()
+        if self.server is not None:
+            try:
+                self.server.noop()  # Check that the cached connection is still usable
+            except (smtplib.SMTPServerDisconnected, socket.error):
+                print("Cached SMTP connection is stale, reconnecting")
+                self._discard()
+        if self.server is None:
+            self._connect()
+        return self.server
+
+    def sendmail(self, from_addr, to_addr, message):
+        """
+        Send a message, retrying once on a fresh connection if the server disconnects.
+
+        Note: if the server drops the connection after it has already accepted the
+        message data, the retry delivers the email a second time.
+        """
+        try:
+            self._get_server().sendmail(from_addr, to_addr, message)
+        except smtplib.SMTPServerDisconnected:
+            print("SMTP server disconnected during send, retrying once")
+            self._discard()
+            self._get_server().sendmail(from_addr, to_addr, message)
+        self.messages_sent += 1
+
+# SMTP connection kept alive across warm Lambda invocations
+_smtp = _SMTPConnection()
+
 def send_email(recipient_email, file_url):
     """
     Send an email to the specified recipient with the download link.
@@ -81,12 +209,6 @@ def send_email(recipient_email, file_url):
         recipient_email (str): Email address of the recipient.
         file_url (str): Presigned URL for downloading the processed file.
     """
-    # Email sender credentials
-    sender_email = "dibhavsar214@gmail.com"  # Replace with your email
-    sender_password = "dmmc bqeh zdfw ticx"  # Replace with your app-specific password or email password
-    smtp_server = "smtp.gmail.com"  # Gmail SMTP server
-    smtp_port = 587  # SMTP port for TLS
-
     # Email content
     subject = "Your Processed File is Ready"
     body = f"Your processed file is available for download at the following link:\n\n{file_url}"
@@ -99,12 +221,9 @@ def send_email(recipient_email, file_url):
     msg.attach(MIMEText(body, 'plain'))
 
     try:
-        # Establish connection to the SMTP server and send the email
-        with smtplib.SMTP(smtp_server, smtp_port) as server:
-            server.starttls()  # Secure the connection using TLS
-            server.login(sender_email, sender_password)  # Login to the SMTP server
-            server.sendmail(sender_email, recipient_email, msg.as_string())  # Send the email
-            print(f"Email sent successfully to {recipient_email}")
+        # Send over the cached SMTP connection (opened or recycled as needed)
+        _smtp.sendmail(sender_email, recipient_email, msg.as_string())  # Send the email
+        print(f"Email sent successfully to {recipient_email}")
     except Exception as e:
         print(f"Error sending email: {e}")
         raise
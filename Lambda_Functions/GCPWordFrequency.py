@@ -1,21 +1,118 @@
 from google.cloud import firestore, storage, bigquery
+from google.cloud import bigquery_storage_v1
+from google.cloud.bigquery_storage_v1 import types as bq_storage_types, writer
+from google.protobuf import descriptor_pb2, descriptor_pool, message_factory
 import json
 import uuid
+import io
 import re
 import collections
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import functions_framework
 from flask import make_response
 
-# Initialize clients for Firestore, Google Cloud Storage, and BigQuery
+# Initialize clients for Firestore, Google Cloud Storage, BigQuery, and the BigQuery Storage Write API
 db = firestore.Client()
 storage_client = storage.Client()
 bigquery_client = bigquery.Client()
+bigquery_write_client = bigquery_storage_v1.BigQueryWriteClient()
 
 # Define constants for the resources used
 bucket_name = 'dp3--txt-file-storage'  # Cloud Storage bucket for file storage
 dataset_name = 'process_3'  # BigQuery dataset
 table_name = 'data_3'  # BigQuery table for word frequency data
+insert_chunk_size = 500  # Maximum rows sent per BigQuery append request
+
+# Protobuf schema of a word-frequency row, built once and reused across warm invocations
+_row_descriptor = descriptor_pb2.DescriptorProto(
+    name="WordFreqRow",
+    field=[
+        descriptor_pb2.FieldDescriptorProto(name=name, number=number, type=field_type,
+                                            label=descriptor_pb2.FieldDescriptorProto.LABEL_OPTIONAL)
+        for number, (name, field_type) in enumerate([
+            ("document_id", descriptor_pb2.FieldDescriptorProto.TYPE_STRING),
+            ("word", descriptor_pb2.FieldDescriptorProto.TYPE_STRING),
+            ("frequency", descriptor_pb2.FieldDescriptorProto.TYPE_INT64),
+            ("file_name", descriptor_pb2.FieldDescriptorProto.TYPE_STRING),
+            ("email", descriptor_pb2.FieldDescriptorProto.TYPE_STRING),
+        ], start=1)
+    ],
+)
+_row_pool = descriptor_pool.DescriptorPool()
+_row_pool.Add(descriptor_pb2.FileDescriptorProto(
+    name="word_freq_row.proto", package="qdp", syntax="proto2", message_type=[_row_descriptor]
+))
+WordFreqRow = message_factory.GetMessageClass(_row_pool.FindMessageTypeByName("qdp.WordFreqRow"))
+
+# Append request template targeting the table's default write stream
+_append_template = bq_storage_types.AppendRowsRequest(
+    write_stream=f"{bigquery_write_client.table_path(bigquery_client.project, dataset_name, table_name)}/streams/_default",
+    proto_rows=bq_storage_types.AppendRowsRequest.ProtoData(
+        writer_schema=bq_storage_types.ProtoSchema(proto_descriptor=_row_descriptor)
+    ),
+)
+
+
+# Word patterns compiled once and reused across warm invocations; for ASCII text
+# the bytes pattern matches exactly what the str \w+ pattern matches
+_WORD_RE = re.compile(r"\w+")
+_ASCII_WORD_RE = re.compile(rb"[a-z0-9_]+")
+
+def count_words(file_content, raw_content):
+    """
+    Count the frequency of each word (case-insensitive) in the file content.
+
+    ASCII content is matched on its lower-cased UTF-8 bytes, which is faster;
+    anything else uses the Unicode-aware str pattern so non-ASCII words stay intact.
+
+    Args:
+        file_content (str): The file content.
+        raw_content (bytes): The same content encoded as UTF-8.
+
+    Returns:
+        collections.Counter: Mapping of word (bytes or str) to its frequency.
+    """
+    if file_content.isascii():
+        return collections.Counter(_ASCII_WORD_RE.findall(raw_content.lower()))
+    return collections.Counter(_WORD_RE.findall(file_content.lower()))
+
+def insert_word_counts(word_count, document_id, file_name, email):
+    """
+    Append one row per word to the word-frequency table through the Storage Write API
+    default stream, in chunks of insert_chunk_size.
+
+    Args:
+        word_count (dict): Mapping of word (bytes or str) to its frequency.
+        document_id (str): Unique identifier of the processed file.
+        file_name (str): Name of the processed file.
+        email (str): User's email.
+    """
+    if not word_count:
+        return
+
+    # The fields shared by every row are serialized once; concatenated protobuf
+    # encodings parse as a single message, so each row is its word fields plus these bytes
+    shared_fields = WordFreqRow(document_id=document_id, file_name=file_name, email=email).SerializeToString()
+    serialized_rows = [
+        WordFreqRow(word=word, frequency=count).SerializeToString() + shared_fields
+        for word, count in word_count.items()
+    ]
+
+    append_rows_stream = writer.AppendRowsStream(bigquery_write_client, _append_template)
+    try:
+        futures = []
+        for i in range(0, len(serialized_rows), insert_chunk_size):
+            request = bq_storage_types.AppendRowsRequest(
+                proto_rows=bq_storage_types.AppendRowsRequest.ProtoData(
+                    rows=bq_storage_types.ProtoRows(serialized_rows=serialized_rows[i:i + insert_chunk_size])
+                )
+            )
+            futures.append(append_rows_stream.send(request))
+        for future in futures:
+            future.result()  # Raises if BigQuery rejected the append
+    finally:
+        append_rows_stream.close()
 
 @functions_framework.http
 def store_file(request):
@@ -58,9 +155,9 @@ def store_file(request):
         unique_id = uuid.uuid4().hex
         temp_id = unique_id + file_name  # Temporary ID that combines UUID with file name for uniqueness
 
-        # Save metadata about the file to Firestore
+        # Metadata saved to Firestore while the file is processed
         doc_ref = db.collection("file_metadata").document(unique_id)
-        doc_ref.set({
+        metadata = {
             "id": unique_id,
             "fileName": file_name,
             "email": email,
@@ -68,39 +165,35 @@ def store_file(request):
             "location": f"gs://{bucket_name}/uploads/{temp_id}",
             "status": "Processing",  # Set initial status as 'Processing'
             "referenceId": reference_id
-        })
+        }
 
-        # Store the file content in Google Cloud Storage
+        # Encode the file content once; the same bytes back both the upload and the word count
+        raw_content = file_content.encode('utf-8', 'ignore')
+
+        # Run the Firestore write and Cloud Storage upload while the words are counted
         bucket = storage_client.bucket(bucket_name)
         blob = bucket.blob(f"uploads/{temp_id}")
-        blob.upload_from_string(file_content, content_type="text/plain")
-
-        # Compute word frequencies from the file content (text processing)
-        words = re.findall(r'\b\w+\b', file_content.lower())  # Find all words (case-insensitive)
-        word_count = collections.Counter(words)  # Count the frequency of each word
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            metadata_future = executor.submit(doc_ref.set, metadata)
+            upload_future = executor.submit(
+                blob.upload_from_file, io.BytesIO(raw_content), size=len(raw_content), content_type="text/plain"
+            )
 
-        # Prepare data for BigQuery (each word and its frequency)
-        rows_to_insert = [
-            {"document_id": unique_id, "word": word, "frequency": count, "file_name": file_name, "email": email}
-            for word, count in word_count.items()
-        ]
+            # Compute word frequencies from the file content (text processing)
+            word_count = count_words(file_content, raw_content)  # Count the frequency of each word
 
-        # BigQuery table ID, including project, dataset, and table name
-        table_id = f"{bigquery_client.project}.{dataset_name}.{table_name}"
+            for future in (metadata_future, upload_future):
+                future.result()  # Re-raise any failure from the worker threads
 
-        # Insert each word-frequency pair into BigQuery
-        for row in rows_to_insert:
-            query = f"""
-            INSERT INTO {table_id} (document_id, word, frequency, file_name, email)
-            VALUES ("{row['document_id']}", "{row['word']}", {row['frequency']}, "{row['file_name']}", "{row['email']}")
-            """
-            bigquery_client.query(query).result()  # Run the query and wait for it to complete
+        # Insert each word and its frequency into BigQuery only once the file is stored,
+        # since rows appended to the default stream cannot be rolled back
+        insert_word_counts(word_count, unique_id, file_name, email)
 
         # Update the Firestore document status to 'Ready' after successful processing
-        doc_ref.update({
+        doc_ref.set({
             "status": "Ready for Looker Studio",  # Indicate that the file is ready for further use
             "processedAt": firestore.SERVER_TIMESTAMP
-        })
+        }, merge=True)
 
         # Set CORS headers for the response to allow client-side JavaScript to access the response
         response.headers['Access-Control-Allow-Origin'] = '*'  # Allow any origin or specify a specific origin
@@ -116,10 +209,10 @@ def store_file(request):
     except Exception as e:
         # If an error occurs, update Firestore document status to 'Failed' and log the error message
         if 'doc_ref' in locals():
-            doc_ref.update({
+            doc_ref.set({
                 "status": "Failed",  # Indicate that the processing failed
                 "errorMessage": str(e)  # Store the error message
-            })
+            }, merge=True)
 
         # Return an error response with the error message
         response.data = json.dumps({"error": str(e)})
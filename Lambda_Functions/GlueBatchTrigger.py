@@ -0,0 +1,144 @@
+import os
+import json
+import boto3
+from datetime import datetime
+
+# Initialize AWS Glue, SQS and DynamoDB clients
+glue = boto3.client('glue')
+sqs = boto3.client('sqs')
+ddb = boto3.client('dynamodb')
+table_name = 'processing-1'
+
+# Queue of inputs staged by GlueJobTrigger, configured on the function
+queue_url = os.environ['GLUE_INPUT_QUEUE_URL']
+
+# Define constants for the batched job
+output_path = "s3://processed-json-files/another-sample.csv/"  # Output S3 file path
+max_batch_size = 100  # Maximum number of inputs handed to a single Glue job run
+
+def mark_running(reference_id, job_id, job_start_time):
+    """
+    Record that a queued input has been handed to a Glue job run, keeping the
+    attributes GlueJobTrigger wrote when it was queued.
+    """
+    ddb.update_item(
+        TableName=table_name,
+        Key={'reference_id': {'S': reference_id}},
+        UpdateExpression="set job_status = :status, jobId = :job_id, job_start_time = :start_time",
+        ExpressionAttributeValues={
+            ':status': {'S': 'RUNNING'},  # Status once the job has started
+            ':job_id': {'S': job_id},  # Glue job ID shared by the batch
+            ':start_time': {'S': job_start_time}  # Job start time
+        }
+    )
+
+def delete_messages(receipt_handles):
+    """
+    Delete received messages from the SQS queue, 10 per DeleteMessageBatch call.
+
+    Returns:
+        list: Receipt handles that could not be deleted.
+    """
+    failed_handles = []
+    for i in range(0, len(receipt_handles), 10):
+        chunk = receipt_handles[i:i + 10]
+        try:
+            response = sqs.delete_message_batch(
+                QueueUrl=queue_url,
+                Entries=[{'Id': str(j), 'ReceiptHandle': handle} for j, handle in enumerate(chunk)]
+            )
+            for entry in response.get('Failed', []):
+                print(f"Error deleting message: {entry}")
+                failed_handles.append(chunk[int(entry['Id'])])
+        except Exception as sqs_error:
+            print(f"Error deleting messages: {sqs_error}")
+            failed_handles.extend(chunk)
+    return failed_handles
+
+def receive_inputs():
+    """
+    Drain up to max_batch_size staged inputs from the SQS queue.
+
+    Returns:
+        tuple: (inputs, receipt_handles) for the received messages.
+    """
+    inputs = []
+    receipt_handles = []
+    while len(inputs) < max_batch_size:
+        response = sqs.receive_message(
+            QueueUrl=queue_url,
+            MaxNumberOfMessages=min(10, max_batch_size - len(inputs)),  # SQS returns at most 10 per call
+            WaitTimeSeconds=1
+        )
+        messages = response.get('Messages', [])
+        if not messages:
+            break
+        for message in messages:
+            inputs.append(json.loads(message['Body']))
+            receipt_handles.append(message['ReceiptHandle'])
+    return inputs, receipt_handles
+
+def lambda_handler(event, context):
+    """
+    Scheduled Lambda handler that drains the staged inputs from SQS, starts a
+    single AWS Glue job run for the whole batch, and logs the job status in DynamoDB.
+
+    Args:
+        event: The scheduled (CloudWatch Events) payload, unused.
+        context: The Lambda runtime information.
+
+    Returns:
+        dict: A response with status code and message indicating success or failure.
+    """
+    try:
+        inputs, receipt_handles = receive_inputs()
+        if not inputs:
+            return {
+                'statusCode': 200,
+                'body': json.dumps({'message': 'No queued inputs'}),
+            }
+
+        # Start one Glue job for every queued input
+        job_start_time = datetime.utcnow().isoformat()
+        params = {
+            'JobName': 'json-to-csv',  # Glue job name
+            'Arguments': {
+                '--inputs': json.dumps(inputs),
+                '--output_path': output_path
+            }
+        }
+
+        glue_response = glue.start_job_run(**params)
+        job_id = glue_response['JobRunId']
+
+        # Record the job ID and status for every input in DynamoDB first, so a failure
+        # below can never leave an input that the job already owns marked as QUEUED
+        for item in inputs:
+            try:
+                mark_running(item['reference_id'], job_id, job_start_time)
+            except Exception as dynamo_error:
+                print(f"Error updating DynamoDB entry {item['reference_id']}: {dynamo_error}")
+
+        # Remove the messages now that the job owns them; failures are logged rather than
+        # raised, since the job has already started
+        failed_handles = delete_messages(receipt_handles)
+        if failed_handles:
+            failed_handles = delete_messages(failed_handles)  # Retry the failed deletes once
+        if failed_handles:
+            print(f"Error deleting {len(failed_handles)} messages for Glue job {job_id}; they may be redelivered")
+
+        return {
+            'statusCode': 200,
+            'body': json.dumps({
+                'message': 'Batched Glue job started!',
+                'glueJobId': job_id,
+                'reference_ids': [item['reference_id'] for item in inputs]
+            }),
+        }
+
+    except Exception as error:
+        print(f"Error in Lambda function: {error}")
+        return {
+            'statusCode': 500,
+            'body': json.dumps('Error starting batched Glue job'),
+        }
@@ -1,26 +1,54 @@
+import os
 import json
 import boto3
 from urllib.parse import unquote_plus
 from datetime import datetime
-import random
-import string
+import time
+import secrets
 
-# Initialize AWS Glue and DynamoDB clients
-glue = boto3.client('glue')
-dynamodb = boto3.resource('dynamodb')
-table = dynamodb.Table('processing-1')  
+# Initialize SQS and DynamoDB clients
+sqs = boto3.client('sqs')
+ddb = boto3.client('dynamodb')
+table_name = 'processing-1'
+max_write_attempts = 5  # BatchWriteItem calls per chunk before giving up on unprocessed items
+
+# Queue that stages inputs for batched Glue runs (drained by GlueBatchTrigger), configured on the function
+queue_url = os.environ['GLUE_INPUT_QUEUE_URL']
 
 def generate_reference_id():
     """
     Generate a unique reference ID in the format REF123456.
     The ID consists of 'REF' followed by 6 random digits.
     """
-    return 'REF' + ''.join(random.choices(string.digits, k=6))
+    return f"REF{secrets.randbelow(1_000_000):06d}"
+
+def _marshal(item):
+    """
+    Convert a flat dict of string values into a DynamoDB AttributeValue map.
+    """
+    return {key: {'S': value} for key, value in item.items()}
+
+def _batch_put(items):
+    """
+    Write items to DynamoDB with the low-level client, 25 per BatchWriteItem call,
+    resending any unprocessed items with exponential backoff.
+    """
+    for i in range(0, len(items), 25):
+        request_items = {table_name: [{'PutRequest': {'Item': _marshal(item)}} for item in items[i:i + 25]]}
+        for attempt in range(max_write_attempts):
+            response = ddb.batch_write_item(RequestItems=request_items)
+            request_items = response.get('UnprocessedItems')
+            if not request_items:
+                break
+            if attempt + 1 < max_write_attempts:
+                time.sleep(0.05 * 2 ** attempt)  # Back off before resending throttled items
+        else:
+            raise Exception(f"DynamoDB left items unprocessed after {max_write_attempts} attempts: {request_items}")
 
 def lambda_handler(event, context):
     """
-    Lambda handler function to process an S3 event, start an AWS Glue job,
-    and log the job status in DynamoDB.
+    Lambda handler function to process an S3 event, stage each record on the
+    SQS queue for the next batched AWS Glue run, and log the job statuses in DynamoDB.
 
     Args:
         event: The event payload, which includes S3 object information.
@@ -30,70 +58,100 @@ def lambda_handler(event, context):
         dict: A response with status code and message indicating success or failure.
     """
     try:
-        # Extract S3 bucket name and object key from the event
-        bucket_name = event['Records'][0]['s3']['bucket']['name']
-        object_key = unquote_plus(event['Records'][0]['s3']['object']['key'])
-
-        # Parse email and filename from the object key
-        path_parts = object_key.split('/')
-        file_path = path_parts[-1]  # Extract the last part of the path (filename)
-        
-        # Safely split the file name into email and actual file name
-        file_parts = file_path.split('_', 1)
-        if len(file_parts) == 2:
-            email, filename = file_parts
-        else:
-            print(f"Error: Unexpected file name format: {file_path}")
+        dynamo_items = []  # Job details to write to DynamoDB in one batch
+        messages = []  # Glue inputs to stage on the SQS queue
+
+        # Process every S3 record delivered in this notification
+        for record in event['Records']:
+            # Extract S3 bucket name and object key from the record
+            bucket_name = record['s3']['bucket']['name']
+            object_key = unquote_plus(record['s3']['object']['key'])
+
+            # Parse email and filename from the object key
+            path_parts = object_key.split('/')
+            file_path = path_parts[-1]  # Extract the last part of the path (filename)
+
+            # Safely split the file name into email and actual file name
+            file_parts = file_path.split('_', 1)
+            if len(file_parts) == 2:
+                email, filename = file_parts
+            else:
+                print(f"Error: Unexpected file name format: {file_path}")
+                continue
+
+            # Generate a unique reference ID for this job
+            reference_id = generate_reference_id()
+
+            # Describe the Glue input; the batch trigger starts the job later
+            messages.append({
+                'input_path': f"s3://{bucket_name}/{object_key}",  # Input S3 file path
+                'reference_id': reference_id,
+                'email': email,
+                'file_name': filename
+            })
+
+            # Collect job details and status for DynamoDB
+            dynamo_items.append({
+                'reference_id': reference_id,  # Unique reference ID
+                'job_queued_time': datetime.utcnow().isoformat(),  # Time the input was staged
+                'job_status': 'QUEUED',  # Initial status
+                'file_name': filename,  # Name of the processed file
+                'email': email  # User's email extracted from file name
+            })
+
+        if not messages:
             return {
                 'statusCode': 400,
                 'body': json.dumps({'message': 'Invalid file name format'}),
             }
-        
-        # Generate a unique reference ID for this job
-        reference_id = generate_reference_id()
-
-    
-        # Start the Glue job with appropriate parameters
-        job_start_time = datetime.utcnow().isoformat()
-        input_path = f"s3://{bucket_name}/{object_key}"  # Input S3 file path
-        output_path = "s3://processed-json-files/another-sample.csv/"  # Output S3 file path
-
-        params = {
-            'JobName': 'json-to-csv',  # Glue job name
-            'Arguments': {
-                '--input_path': input_path,
-                '--output_path': output_path,
-                '--reference_ID': reference_id,
-                '--email': email
-            }
-        }
 
-        glue_response = glue.start_job_run(**params)
-        job_id = glue_response['JobRunId']
-
-        # Insert job details and status into DynamoDB
-        dynamo_params = {
-            'reference_id': reference_id,  # Unique reference ID
-            'jobId': job_id,  # Glue job ID
-            'job_start_time': job_start_time,  # Job start time
-            'job_status': 'RUNNING',  # Initial status
-            'file_name': filename,  # Name of the processed file
-            'email': email  # User's email extracted from file name
-        }
-
-        # Add entry to DynamoDB
+        # Add all entries to DynamoDB in a single batch, before queueing, so the batch
+        # trigger's RUNNING update can never be overwritten by the QUEUED entry
         try:
-            table.put_item(Item=dynamo_params)  
-            print(f"DynamoDB entry inserted successfully: {dynamo_params}")
+            _batch_put(dynamo_items)
+            print(f"DynamoDB entries inserted successfully: {dynamo_items}")
         except Exception as dynamo_error:
-            print(f"Error inserting entry into DynamoDB: {dynamo_error}")
+            print(f"Error inserting entries into DynamoDB: {dynamo_error}")
+
+        # Stage the inputs on SQS, 10 per SendMessageBatch call, collecting any that fail
+        failed_ids = []
+        for i in range(0, len(messages), 10):
+            chunk = messages[i:i + 10]
+            entries = [
+                {'Id': str(j), 'MessageBody': json.dumps(message)}
+                for j, message in enumerate(chunk)
+            ]
+            try:
+                sqs_response = sqs.send_message_batch(QueueUrl=queue_url, Entries=entries)
+                failed_ids.extend(chunk[int(entry['Id'])]['reference_id'] for entry in sqs_response.get('Failed', []))
+            except Exception as sqs_error:
+                print(f"Error queueing inputs: {sqs_error}")
+                failed_ids.extend(message['reference_id'] for message in chunk)
+
+        if failed_ids:
+            print(f"Failed to queue inputs: {failed_ids}")
+            # Mark the inputs that never reached the queue as failed
+            try:
+                _batch_put([
+                    dict(item, job_status='FAILED') for item in dynamo_items if item['reference_id'] in failed_ids
+                ])
+            except Exception as dynamo_error:
+                print(f"Error marking entries as failed in DynamoDB: {dynamo_error}")
+            return {
+                'statusCode': 500,
+                'body': json.dumps({
+                    'message': 'Some files could not be queued for the Glue job',
+                    'failed_reference_ids': failed_ids,
+                    'reference_ids': [message['reference_id'] for message in messages
+                                      if message['reference_id'] not in failed_ids]
+                }),
+            }
 
         return {
             'statusCode': 200,
             'body': json.dumps({
-                'message': 'File processed successfully and job started!',
-                'glueJobId': job_id,
-                'reference_id': reference_id
+                'message': 'Files processed successfully and queued for the next Glue job!',
+                'reference_ids': [message['reference_id'] for message in messages]
             }),
         }
 
@@ -101,5 +159,5 @@ def lambda_handler(event, context):
         print(f"Error in Lambda function: {error}")
         return {
             'statusCode': 500,
-            'body': json.dumps('Error processing file and starting Glue job'),
+            'body': json.dumps('Error processing file and queueing Glue job'),
         }
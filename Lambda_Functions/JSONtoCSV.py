@@ -1,4 +1,5 @@
 import sys
+import json
 import boto3
 from botocore.exceptions import NoCredentialsError, PartialCredentialsError
 from awsglue.transforms import *
@@ -19,37 +20,45 @@ dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
 table = dynamodb.Table('processing-1')  
 
 
-def read_nested_json(df):
+def _collect_projections(schema, prefix="", path=""):
     """
-    Flatten one level of nested JSON structure.
-    
+    Walk a schema recursively and build the projection list that flattens every nested struct.
+
     Parameters:
-        df (DataFrame): Input Spark DataFrame with potentially nested JSON data.
-    
+        schema (StructType): Schema (or nested struct type) to walk.
+        prefix (str): Flattened column name of the enclosing struct, joined with '_'.
+        path (str): Dotted path of the enclosing struct in the source DataFrame.
+
     Returns:
-        DataFrame: Flattened DataFrame after processing arrays and structs.
+        tuple: (projections, arrays) where projections is the list of Columns to select and
+        arrays is a list of (path, alias, element_type) for array fields that must be exploded first.
     """
-    column_list = []
-    for column_name in df.schema.names:
-        # Check if the column is an array; if so, explode it
-        if isinstance(df.schema[column_name].dataType, ArrayType):
-            df = df.withColumn(column_name, explode(column_name))
-            column_list.append(column_name)
-        # Check if the column is a struct; if so, flatten it into subfields
-        elif isinstance(df.schema[column_name].dataType, StructType):
-            for field in df.schema[column_name].dataType.fields:
-                column_list.append(col(column_name + "." + field.name).alias(column_name + "_" + field.name))
-        # Retain all other columns as is
+    projections = []
+    arrays = []
+    for field in schema.fields:
+        field_path = path + "." + field.name if path else field.name
+        alias = prefix + "_" + field.name if prefix else field.name
+        # Descend into structs, naming leaves after their full path
+        if isinstance(field.dataType, StructType):
+            sub_projections, sub_arrays = _collect_projections(field.dataType, alias, field_path)
+            projections.extend(sub_projections)
+            arrays.extend(sub_arrays)
+        # Arrays are exploded into a column named after their flattened path
+        elif isinstance(field.dataType, ArrayType):
+            arrays.append((field_path, alias, field.dataType.elementType))
+            projections.append(col(alias))
+        # Retain all other columns under their flattened name
         else:
-            column_list.append(column_name)
-    # Return the modified DataFrame with selected columns
-    df = df.select(column_list)
-    return df
+            projections.append(col(field_path).alias(alias))
+    return projections, arrays
 
 
 def flatten(df):
     """
-    Recursively flatten a nested JSON structure until no more nested fields remain.
+    Flatten a nested JSON structure until no more nested fields remain.
+
+    Structs are flattened in a single select; another pass is only needed
+    when an exploded array contains further nested fields.
     
     Parameters:
         df (DataFrame): Input Spark DataFrame with nested JSON data.
@@ -57,18 +66,15 @@ def flatten(df):
     Returns:
         DataFrame: Fully flattened DataFrame.
     """
-    read_nested_json_flag = True
-    while read_nested_json_flag:
-        # Apply the flattening logic
-        df = read_nested_json(df)
-        read_nested_json_flag = False
-        # Check if further flattening is required by inspecting the schema
-        for column_name in df.schema.names:
-            if isinstance(df.schema[column_name].dataType, ArrayType):
-                read_nested_json_flag = True
-            elif isinstance(df.schema[column_name].dataType, StructType):
-                read_nested_json_flag = True
-    return df
+    while True:
+        projections, arrays = _collect_projections(df.schema)
+        # Explode every array at this level, then project all leaves at once
+        for path, alias, _ in arrays:
+            df = df.withColumn(alias, explode(col(path)))
+        df = df.select(*projections)
+        # Stop unless an exploded array yielded structs or arrays
+        if not any(isinstance(element_type, (StructType, ArrayType)) for _, _, element_type in arrays):
+            return df
 
 
 def update_dynamodb_status(reference_id, status, s3_object_key=None):
@@ -120,31 +126,22 @@ def update_dynamodb_status(reference_id, status, s3_object_key=None):
         print(f"Error updating DynamoDB: {e}")
 
 
-def main():
+def process_file(input_file_path, output_path, reference_ID, email):
     """
-    Main function to process a JSON file:
-    - Reads a nested JSON file from S3.
-    - Flattens the JSON data.
-    - Saves the flattened data back to S3 as a CSV.
-    - Updates the job status in DynamoDB.
-    """
-    # Parse input arguments
-    args = getResolvedOptions(sys.argv, ['input_path', 'output_path', 'reference_ID', 'email'])
-    input_file_path = args.get('input_path', '').strip()
-    output_path = args.get('output_path', '').strip()
-    reference_ID = args.get('reference_ID')
-    email = args.get('email')
-    print(f"Email extracted from arguments: {email}")
+    Flatten one JSON input and save it as CSV, recording the outcome in DynamoDB.
 
-    # Validate input arguments
-    if not input_file_path:
-        raise ValueError("The 'input_path' argument is missing or empty.")
-    if not output_path:
-        raise ValueError("The 'output_path' argument is missing or empty.")
+    Parameters:
+        input_file_path (str): S3 path of the nested JSON file.
+        output_path (str): S3 prefix the CSV output is written under.
+        reference_ID (str): The unique reference ID for the job.
+        email (str): The user's email, used in the output path.
 
+    Returns:
+        None
+    """
     print(f"Input file path: {input_file_path}")
-    print(f"Output path: {output_path}")
     print(f"Reference ID: {reference_ID}")
+    print(f"Email: {email}")
 
     try:
         # Read the JSON file from S3
@@ -170,7 +167,52 @@ def main():
         # Log the error and update the DynamoDB status to indicate failure
         print(f"Error processing file: {e}")
         update_dynamodb_status(reference_ID, "FAILED")
-        raise  # Re-raise the exception to mark the Glue job as failed
+        raise
+
+
+def main():
+    """
+    Main function to process JSON files:
+    - Reads nested JSON files from S3, either a single '--input_path' or a
+      batch given as a JSON array in '--inputs' (staged by GlueBatchTrigger).
+    - Flattens the JSON data.
+    - Saves the flattened data back to S3 as a CSV.
+    - Updates the job status in DynamoDB.
+    """
+    # Batched runs pass every input in one JSON argument
+    if '--inputs' in sys.argv:
+        args = getResolvedOptions(sys.argv, ['inputs', 'output_path'])
+        inputs = json.loads(args['inputs'])
+    else:
+        args = getResolvedOptions(sys.argv, ['input_path', 'output_path', 'reference_ID', 'email'])
+        inputs = [{
+            'input_path': args.get('input_path', ''),
+            'reference_id': args.get('reference_ID'),
+            'email': args.get('email')
+        }]
+    output_path = args.get('output_path', '').strip()
+
+    # Validate input arguments
+    if not output_path:
+        raise ValueError("The 'output_path' argument is missing or empty.")
+    for item in inputs:
+        if not item.get('input_path', '').strip():
+            raise ValueError("The 'input_path' argument is missing or empty.")
+
+    print(f"Output path: {output_path}")
+    print(f"Number of inputs: {len(inputs)}")
+
+    # Process every input, so one bad file does not fail the rest of the batch
+    failed = []
+    for item in inputs:
+        try:
+            process_file(item['input_path'].strip(), output_path, item['reference_id'], item['email'])
+        except Exception:
+            failed.append(item['reference_id'])
+
+    if failed:
+        # Raise to mark the Glue job as failed
+        raise RuntimeError(f"Processing failed for reference IDs: {failed}")
 
 
 # Entry point for the script
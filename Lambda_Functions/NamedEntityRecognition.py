@@ -1,24 +1,76 @@
+import os
+
+# Keep the math libraries single-threaded on the 1-2 vCPU Lambda to avoid thread-startup stalls
+os.environ.setdefault("OMP_NUM_THREADS", "1")
+
 import json
 import boto3
 import spacy
 import en_core_web_sm
+from thinc.api import require_cpu
 import base64
+import hashlib
+from collections import OrderedDict
 from datetime import datetime
-import random
-import string
+import secrets
 from urllib.parse import parse_qs
-import cgi
+from streaming_form_data import StreamingFormDataParser
+from streaming_form_data.targets import ValueTarget
+
+# Pipeline components whose output is unused; only doc.ents is read, and in en_core_web_sm
+# the ner component has its own internal tok2vec rather than listening to the shared one
+unused_components = ["tok2vec", "tagger", "parser", "senter", "attribute_ruler", "lemmatizer"]
+
+# Prebuilt NER-only model shipped in the Lambda layer (built with build_ner_model.py)
+minimal_model_path = '/opt/en_core_web_sm_minimal'
 
-# Initialize spaCy model for Named Entity Recognition (NER)
-nlp = en_core_web_sm.load()
+# Initialize spaCy model for Named Entity Recognition (NER), preferring the prebuilt minimal model
+require_cpu()
+if os.path.isdir(minimal_model_path):
+    nlp = spacy.load(minimal_model_path)
+else:
+    nlp = en_core_web_sm.load(exclude=unused_components)
 
-# Initialize DynamoDB resource and reference the table
-dynamodb = boto3.resource('dynamodb')
-table = dynamodb.Table('processing-1')
+# NER is the only component needed, so it is called directly instead of through nlp()
+ner = nlp.get_pipe('ner')
+
+# Initialize the low-level DynamoDB client and name the table
+ddb = boto3.client('dynamodb')
+table_name = 'processing-1'
 
 # Function to generate a reference ID for each request
 def generate_reference_id():
-    return 'REF' + ''.join(random.choices(string.digits, k=6))  # Generates a reference ID like REF123456
+    return f"REF{secrets.randbelow(1_000_000):06d}"  # Generates a reference ID like REF123456
+
+# Write an item of string attributes to DynamoDB, marshalling it directly into AttributeValues
+def _put(item):
+    ddb.put_item(TableName=table_name, Item={key: {'S': value} for key, value in item.items()})
+
+# Entities of recently processed documents, keyed by content digest (least recently used first)
+_entity_cache = OrderedDict()
+entity_cache_size = 256
+
+def _ner(content_hash, text):
+    """
+    Run spaCy NER on the text, caching results by digest so re-submitted documents skip the pipeline.
+
+    Args:
+        content_hash (str): BLAKE2b digest of the raw file bytes, the cache key.
+        text (str): The decoded file content, only processed on a cache miss.
+
+    Returns:
+        tuple: Entities as (text, label) tuples.
+    """
+    if content_hash in _entity_cache:
+        _entity_cache.move_to_end(content_hash)
+        return _entity_cache[content_hash]
+
+    doc = ner(nlp.make_doc(text))  # Tokenize, then run only the NER component
+    entities = tuple((ent.text, ent.label_) for ent in doc.ents)  # Extract entities as tuples of (text, label)
+    _entity_cache[content_hash] = entities
+    if len(_entity_cache) > entity_cache_size:
+        _entity_cache.popitem(last=False)  # Evict the least recently used document
+    return entities
 
 def lambda_handler(event, context):
     """
@@ -46,26 +98,32 @@ def lambda_handler(event, context):
         if not content_type.startswith('multipart/form-data'):
             raise Exception('Invalid content type: Expected multipart/form-data')
 
-        # Parse the multipart/form-data body using cgi.FieldStorage
-        form_data = cgi.FieldStorage(
-            fp=event['body'].encode('utf-8') if event.get("isBase64Encoded") else event['body'], 
-            environ={
-                'REQUEST_METHOD': 'POST',
-                'CONTENT_TYPE': content_type,
-            }
-        )
+        # Raw request body bytes (API Gateway Base64-encodes binary bodies)
+        body = event['body']
+        body_bytes = base64.b64decode(body) if event.get("isBase64Encoded") else body.encode('utf-8')
+
+        # Parse the multipart/form-data body with the C-accelerated streaming parser
+        parser = StreamingFormDataParser(headers={'Content-Type': content_type})
+        email_target = ValueTarget()
+        file_name_target = ValueTarget()
+        file_content_target = ValueTarget()  # Kept as bytes so it can go straight to the Base64 decoder
+        parser.register('email', email_target)
+        parser.register('file_name', file_name_target)
+        parser.register('file_content', file_content_target)
+        parser.data_received(body_bytes)
 
         # Extract required form fields: email, file name, and base64-encoded file content
-        email = form_data.getvalue('email')
-        file_name = form_data.getvalue('file_name')
-        file_content_base64 = form_data.getvalue('file_content')
+        email = email_target.value.decode('utf-8')
+        file_name = file_name_target.value.decode('utf-8')
+        file_content_base64 = file_content_target.value
 
         # Validate that all required fields are present
         if not email or not file_name or not file_content_base64:
             raise Exception("Missing required form fields: 'email', 'file_name', or 'file_content'")
 
-        # Decode the Base64-encoded file content to a string
-        file_content = base64.b64decode(file_content_base64).decode('utf-8')
+        # Decode the Base64-encoded file content; the raw bytes are kept for hashing
+        raw_content = base64.b64decode(file_content_base64)
+        file_content = raw_content.decode('utf-8')
 
         # Generate a unique reference ID for the job
         reference_id = generate_reference_id()
@@ -74,8 +132,8 @@ def lambda_handler(event, context):
         job_start_time = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
 
         # Process the file content with spaCy for Named Entity Recognition (NER)
-        doc = nlp(file_content)
-        entities = [(ent.text, ent.label_) for ent in doc.ents]  # Extract entities as tuples of (text, label)
+        content_hash = hashlib.blake2b(raw_content, digest_size=16).hexdigest()
+        entities = _ner(content_hash, file_content)  # Cached for documents already seen by this warm Lambda
 
         # Store job information and metadata in DynamoDB
         dynamo_item = {
@@ -87,7 +145,7 @@ def lambda_handler(event, context):
             'job_status': 'SUCCESS',  # Status of the job (can be SUCCESS or ERROR)
             'job_type': 'NER'  # Type of the job (Named Entity Recognition)
         }
-        table.put_item(Item=dynamo_item)  # Insert job metadata into DynamoDB
+        _put(dynamo_item)  # Insert job metadata into DynamoDB
 
         # Return a success response with the identified entities
         return {
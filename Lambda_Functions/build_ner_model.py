@@ -0,0 +1,29 @@
+import sys
+import en_core_web_sm
+
+# Pipeline components excluded from the NER model (keep in sync with NamedEntityRecognition.py)
+unused_components = ["tok2vec", "tagger", "parser", "senter", "attribute_ruler", "lemmatizer"]
+
+def main():
+    """
+    Layer build step: save the NER-only spaCy pipeline so Lambda cold starts skip the unused weights.
+
+    Usage:
+        python build_ner_model.py <layer_staging_dir>/en_core_web_sm_minimal
+
+    The layer is mounted under /opt, so the saved model is loaded at runtime
+    from /opt/en_core_web_sm_minimal.
+    """
+    if len(sys.argv) != 2:
+        print("Usage: python build_ner_model.py <output_dir>")
+        sys.exit(1)
+    output_dir = sys.argv[1]
+
+    nlp = en_core_web_sm.load(exclude=unused_components)
+    nlp.to_disk(output_dir)
+    print(f"Saved NER-only model with pipeline {nlp.pipe_names} to {output_dir}")
+
+
+# Entry point for the script
+if __name__ == "__main__":
+    main()